@@ -2,31 +2,102 @@
 # 🟢 Raspberry Pi Live Anomaly Detector (Safe & Normalized)
 # ==========================================
 
+import os
+import queue
+import re
+import signal
+import threading
 import time
 import statistics
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 import psutil
-import pandas as pd
 import serial
-import firebase_admin
-from firebase_admin import credentials, firestore
 import joblib
 import numpy as np
 
+try:
+    from icmplib import ping as icmp_ping
+except ImportError:
+    # icmplib is optional; without it ping_test shells out to ping
+    icmp_ping = None
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    # onnxruntime is optional; without it the scikit-learn model is used
+    ort = None
+
+try:
+    from numba import njit
+except ImportError:
+    # numba is optional; without it the decorated functions run as plain Python
+    def njit(*args, **kwargs):
+        return lambda f: f
+
 # -----------------------------
 # 1️⃣ Initialize Firebase
 # -----------------------------
-cred = credentials.Certificate("/home/admin/firebase-key.json")
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+# Deferred until the first batch commit so startup doesn't pay for the SDK import and handshake
+FIREBASE_KEY_PATH = "/home/admin/firebase-key.json"
 firebase_collection = "network_anomalies"
+_db = None
+_anomalies_ref = None
+_firebase_lock = threading.Lock()
+
+def init_firebase():
+    """Initialize Firebase on first use and return (db, anomalies collection)"""
+    global _db, _anomalies_ref
+    with _firebase_lock:
+        if _anomalies_ref is None:
+            import firebase_admin
+            from firebase_admin import credentials, firestore
+            try:
+                firebase_admin.get_app()
+            except ValueError:
+                firebase_admin.initialize_app(credentials.Certificate(FIREBASE_KEY_PATH))
+            _db = firestore.client()
+            _anomalies_ref = _db.collection(firebase_collection)
+    return _db, _anomalies_ref
+
+# Samples are buffered and committed in batches (Firestore allows up to 500 writes per batch)
+BATCH_SIZE = 50
+COMMIT_RETRIES = 3
+# A partial batch is still flushed once its oldest sample is this many seconds old
+FLUSH_INTERVAL = 60.0
+upload_executor = ThreadPoolExecutor(max_workers=4)
+
+# Samples are taken on a fixed cadence, independent of how long each iteration takes
+SAMPLE_INTERVAL = 10.0
+
+# Identical consecutive samples are skipped, but one is still uploaded every HEARTBEAT_SEC
+HEARTBEAT_SEC = 300
+
+# Ping, iwconfig and system metrics are collected concurrently each iteration
+sensor_executor = ThreadPoolExecutor(max_workers=3)
 
 # -----------------------------
 # 2️⃣ Load model + scaler
 # -----------------------------
-model = joblib.load("/home/admin/anomaly_detector.pkl")
+# Prefer the ONNX export of the model (see export_onnx.py) when onnxruntime is available
+MODEL_ONNX_PATH = "/home/admin/anomaly_detector.onnx"
+onnx_session = None
+if ort is not None and os.path.exists(MODEL_ONNX_PATH):
+    onnx_session = ort.InferenceSession(MODEL_ONNX_PATH, providers=["CPUExecutionProvider"])
+    onnx_input = onnx_session.get_inputs()[0].name
+    onnx_label = onnx_session.get_outputs()[0].name
+    model = None
+else:
+    model = joblib.load("/home/admin/anomaly_detector.pkl")
 scaler = joblib.load("/home/admin/scaler.pkl")
 
+def predict_labels(X):
+    """Run the IsolationForest on a scaled batch; -1 marks an anomaly"""
+    if onnx_session is not None:
+        return onnx_session.run([onnx_label], {onnx_input: X.astype(np.float32)})[0]
+    return model.predict(X)
+
 # Define feature order (must match training)
 feature_order = [
     'ambient_temp', 'ax', 'ay', 'az', 'bytes_recv', 'bytes_sent',
@@ -55,16 +126,54 @@ feature_clip_ranges = {
     'wifi_strength': (-100, 0)
 }
 
+# Preallocated model input row, reused every iteration
+FEATURE_IDX = {f: i for i, f in enumerate(feature_order)}
+_row_buf = np.zeros((1, len(feature_order)))
+
+# Clip bounds aligned with feature_order
+CLIP_LO = np.array([feature_clip_ranges[f][0] for f in feature_order], dtype=np.float64)
+CLIP_HI = np.array([feature_clip_ranges[f][1] for f in feature_order], dtype=np.float64)
+
+# The scaler is a MinMaxScaler (X * scale_ + min_); apply it inline instead of via transform()
+SCALE = np.asarray(scaler.scale_, dtype=np.float64)
+OFFSET = np.asarray(scaler.min_, dtype=np.float64)
+if getattr(scaler, "clip", False):
+    SCALED_LO, SCALED_HI = (float(b) for b in scaler.feature_range)
+else:
+    SCALED_LO, SCALED_HI = -np.inf, np.inf
+_scaled_buf = np.empty_like(_row_buf)
+
+# Ring of samples waiting for the next batch commit; documents are only built at commit time
+_pending_rows = np.empty((BATCH_SIZE, len(feature_order)))
+_pending_meta = [None] * BATCH_SIZE  # (timestamp, is_anomaly, category) per row
+_pending_count = 0
+_pending_since = 0.0  # monotonic time of the oldest buffered sample
+
 # -----------------------------
 # 3️⃣ Initialize Arduino Serial
 # -----------------------------
 ser = serial.Serial('/dev/ttyACM0', 9600, timeout=1)
-time.sleep(2)  # allow Arduino to reset
+ser.reset_input_buffer()  # drop anything queued before we started reading
+
+# Newest parsed Arduino sample, filled by the background serial reader
+arduino_queue = queue.Queue(maxsize=1)
 
 # -----------------------------
 # 4️⃣ Functions to collect metrics
 # -----------------------------
 def ping_test(host="8.8.8.8", count=3):
+    if icmp_ping is not None:
+        try:
+            # Unprivileged ICMP socket, no fork/exec or output parsing
+            latencies = icmp_ping(host, count=count, privileged=False).rtts
+            if not latencies:
+                return None, 100, None
+            avg = statistics.mean(latencies)
+            loss = 100 - (len(latencies) / count * 100)
+            jitter = statistics.pstdev(latencies)
+            return avg, loss, jitter
+        except Exception:
+            pass  # e.g. ICMP sockets not permitted for this user; fall back to ping
     try:
         output = subprocess.check_output(["ping", "-c", str(count), host]).decode()
         latencies = [float(line.split('time=')[1].split(' ms')[0])
@@ -85,123 +194,257 @@ def get_wifi_strength():
     except:
         return None
 
-def collect_system_metrics():
+# CPU temperature is read straight from sysfs through a descriptor opened once
+THERMAL_ZONE_PATH = "/sys/class/thermal/thermal_zone0/temp"
+try:
+    _thermal_fd = os.open(THERMAL_ZONE_PATH, os.O_RDONLY)
+except OSError:
+    _thermal_fd = None
+
+def read_cpu_temp():
+    if _thermal_fd is not None:
+        try:
+            # sysfs regenerates the value on every read from offset 0 (millidegrees C)
+            return int(os.pread(_thermal_fd, 16, 0)) / 1000.0
+        except (OSError, ValueError):
+            pass
+    # Fall back to psutil's sensor scan on boards without thermal_zone0
     temps = psutil.sensors_temperatures()
-    temp = None
     if 'cpu_thermal' in temps and len(temps['cpu_thermal']) > 0:
-        temp = temps['cpu_thermal'][0].current
+        return temps['cpu_thermal'][0].current
+    return None
+
+def collect_system_metrics():
     net_io = psutil.net_io_counters()
     return {
-        "cpu_temp": temp,
+        "cpu_temp": read_cpu_temp(),
         "bytes_sent": net_io.bytes_sent,
         "bytes_recv": net_io.bytes_recv,
-        "cpu_load": psutil.cpu_percent()
+        # Non-blocking: load since the previous call
+        "cpu_load": psutil.cpu_percent(interval=None)
     }
 
+# Firmware sends a fixed field order: "T:26.0,H:70.0,M:0,AX:100,AY:200,AZ:300,GX:10,GY:20,GZ:30"
+ARDUINO_FIELDS = ('ambient_temp', 'humidity', 'motion_level', 'ax', 'ay', 'az', 'gx', 'gy', 'gz')
+_ARDUINO_LINE = re.compile(
+    r'T:(-?[\d.]+),H:(-?[\d.]+),M:(-?\d+),AX:(-?\d+),AY:(-?\d+),AZ:(-?\d+),GX:(-?\d+),GY:(-?\d+),GZ:(-?\d+)',
+    re.IGNORECASE
+)
+
+def parse_arduino_line(line):
+    # One regex pass validates the layout and captures all nine values positionally
+    match = _ARDUINO_LINE.fullmatch(line)
+    if match is None:
+        print("Parse error: unexpected line format:", line)
+        return None
+    return dict(zip(ARDUINO_FIELDS, map(float, match.groups())))
+
+def serial_reader():
+    """Continuously drain the serial port so the Arduino's buffer never backs up"""
+    # Lines arrive about once a second; logging one per sample interval keeps the old log volume
+    last_log = 0.0
+    while True:
+        try:
+            raw = ser.readline()
+        except serial.SerialException as e:
+            print("Serial read error:", e)
+            time.sleep(1)
+            continue
+        if not raw:
+            continue  # readline timed out
+        line = raw.decode('utf-8', errors='ignore').strip()
+        now = time.monotonic()
+        if now - last_log >= SAMPLE_INTERVAL:
+            print("Raw Arduino:", line)
+            last_log = now
+        data = parse_arduino_line(line)
+        if data is None:
+            continue
+        # Keep only the newest sample; this is the only producer, so the put can't fail
+        try:
+            arduino_queue.get_nowait()
+        except queue.Empty:
+            pass
+        arduino_queue.put_nowait(data)
+
 def read_arduino_data():
-    if ser.in_waiting > 0:
-        line = ser.readline().decode('utf-8').strip()
-        print("Raw Arduino:", line)
+    try:
+        return arduino_queue.get_nowait()
+    except queue.Empty:
+        return None
+
+# Category codes returned by _categorize
+CATEGORIES = ("Normal", "Thermal", "Motion-Induced", "Weak Signal", "Unknown Network Issue", "System Load")
+
+@njit(cache=True)
+def _categorize(ping_avg, packet_loss, ping_jitter, cpu_temp, cpu_load, motion_level, wifi_strength, eps=1e-6):
+    network_bad = (ping_avg > 100) or (packet_loss > 0.1) or (ping_jitter > 30)
+    jitter_ratio = ping_jitter / (ping_avg + eps)
+
+    if network_bad and (cpu_temp > 65 or cpu_load > 6):
+        return 1
+    if network_bad and (motion_level > 0):
+        return 2
+    if network_bad and (wifi_strength < -70 or ping_jitter > 40 or jitter_ratio > 0.4):
+        return 3
+    if (ping_jitter > 40 or jitter_ratio > 0.6) and (cpu_temp <= 65 and wifi_strength >= -70):
+        return 4
+    if network_bad and cpu_load > 8:
+        return 5
+    return 0
+
+# Positions of _categorize's arguments in feature_order
+CATEGORY_INPUTS = np.array([FEATURE_IDX[f] for f in (
+    "ping_avg", "packet_loss", "ping_jitter", "cpu_temp", "cpu_load", "motion_level", "wifi_strength"
+)])
+
+@njit(cache=True)
+def _process_row(row, lo, hi, scale, offset, scaled_lo, scaled_hi, scaled, cat_idx):
+    """Clip and zero-fill row in place, write its scaled copy into scaled, and return its category code"""
+    for i in range(row.shape[0]):
+        v = row[i]
+        if np.isnan(v):
+            v = 0.0  # missing reading
+        else:
+            v = min(max(v, lo[i]), hi[i])
+        row[i] = v
+        scaled[i] = min(max(v * scale[i] + offset[i], scaled_lo), scaled_hi)
+    return _categorize(
+        row[cat_idx[0]], row[cat_idx[1]], row[cat_idx[2]], row[cat_idx[3]],
+        row[cat_idx[4]], row[cat_idx[5]], row[cat_idx[6]]
+    )
+
+def process_row():
+    """Run the fused clip/scale/categorize kernel on the current row buffer"""
+    return _process_row(
+        _row_buf[0], CLIP_LO, CLIP_HI, SCALE, OFFSET, SCALED_LO, SCALED_HI, _scaled_buf[0], CATEGORY_INPUTS
+    )
+
+# Compile now (on scratch buffers) so the first real sample doesn't pay the JIT cost
+_process_row(
+    np.zeros(len(feature_order)), CLIP_LO, CLIP_HI, SCALE, OFFSET, SCALED_LO, SCALED_HI,
+    np.zeros(len(feature_order)), CATEGORY_INPUTS
+)
+
+def commit_batch(rows, meta):
+    """Write buffered samples to Firestore in a single batch, retrying on failure"""
+    docs = [
+        {"timestamp": ts, "is_anomaly": is_anomaly, "category": category,
+         **dict(zip(feature_order, values))}
+        for values, (ts, is_anomaly, category) in zip(rows.tolist(), meta)
+    ]
+    refs = None
+    for attempt in range(1, COMMIT_RETRIES + 1):
         try:
-            parts = line.split(',')
-            data = {}
-            for p in parts:
-                key, value = p.split(':')
-                key = key.strip().upper()
-                value = value.strip()
-                if key == 'T':
-                    data['ambient_temp'] = float(value)
-                elif key == 'H':
-                    data['humidity'] = float(value)
-                elif key == 'M':
-                    data['motion_level'] = int(value)
-                elif key in ['AX','AY','AZ','GX','GY','GZ']:
-                    data[key.lower()] = int(value)
-            return data
+            db, anomalies_ref = init_firebase()
+            if refs is None:
+                # IDs are generated client-side, once, so a retried commit overwrites instead of duplicating
+                refs = [anomalies_ref.document() for _ in docs]
+            batch = db.batch()
+            for ref, d in zip(refs, docs):
+                batch.set(ref, d)
+            batch.commit()
+            print(f"Committed batch of {len(docs)} samples")
+            return
         except Exception as e:
-            print("Parse error:", e)
-            return None
-    return None
+            print(f"Batch commit failed (attempt {attempt}/{COMMIT_RETRIES}):", e)
+            if attempt < COMMIT_RETRIES:
+                time.sleep(2 ** attempt)
+    print(f"Dropping {len(docs)} samples after {COMMIT_RETRIES} failed commits")
+
+def flush_pending():
+    """Hand the buffered samples to the upload pool without blocking the sensor loop"""
+    global _pending_count
+    if _pending_count:
+        n = _pending_count
+        upload_executor.submit(commit_batch, _pending_rows[:n].copy(), _pending_meta[:n])
+        _pending_count = 0
+
+def queue_sample(is_anomaly, category):
+    """Copy the current row buffer into the pending ring for the next batched upload"""
+    global _pending_count, _pending_since
+    if _pending_count == 0:
+        _pending_since = time.monotonic()
+    # Sample time, since the batch commits later
+    _pending_rows[_pending_count] = _row_buf[0]
+    _pending_meta[_pending_count] = (datetime.now(timezone.utc), is_anomaly, category)
+    _pending_count += 1
+    print(f"Queued sample: is_anomaly={is_anomaly} category={category}")
+    if _pending_count >= BATCH_SIZE:
+        flush_pending()
+
+def flush_if_stale():
+    """Flush a partial batch whose oldest sample has waited FLUSH_INTERVAL seconds"""
+    if _pending_count and time.monotonic() - _pending_since >= FLUSH_INTERVAL:
+        flush_pending()
 
-def categorize_anomaly(row, eps=1e-6):
-    network_bad = (row["ping_avg"] > 100) or (row["packet_loss"] > 0.1) or (row["ping_jitter"] > 30)
-    jitter_ratio = row["ping_jitter"] / (row["ping_avg"] + eps)
-
-    if network_bad and (row["cpu_temp"] > 65 or row["cpu_load"] > 6):
-        return "Thermal"
-    if network_bad and (row["motion_level"] > 0):
-        return "Motion-Induced"
-    if network_bad and (row["wifi_strength"] < -70 or row["ping_jitter"] > 40 or jitter_ratio > 0.4):
-        return "Weak Signal"
-    if (row["ping_jitter"] > 40 or jitter_ratio > 0.6) and (row["cpu_temp"] <= 65 and row["wifi_strength"] >= -70):
-        return "Unknown Network Issue"
-    if network_bad and row["cpu_load"] > 8:
-        return "System Load"
-    return "Normal"
+def store_readings(readings):
+    """Write (feature, value) pairs into the model input buffer, leaving missing ones as NaN"""
+    for f, value in readings:
+        if value is not None:
+            _row_buf[0, FEATURE_IDX[f]] = value
 
 # -----------------------------
 # 5️⃣ Main loop
 # -----------------------------
-while True:
-    # Read all metrics
-    ping_avg, loss, jitter = ping_test()
-    sys_data = collect_system_metrics()
-    arduino_data = read_arduino_data() or {}
-    wifi_strength = get_wifi_strength()
-
-    # Combine into one dict
-    row = {
-        "ambient_temp": None,
-        "ax": None, "ay": None, "az": None,
-        "bytes_recv": None, "bytes_sent": None,
-        "cpu_load": None, "cpu_temp": None,
-        "gx": None, "gy": None, "gz": None,
-        "humidity": None,
-        "motion_level": None,
-        "packet_loss": None,
-        "ping_avg": None,
-        "ping_jitter": None,
-        "wifi_strength": None
-    }
+def _handle_sigterm(signum, frame):
+    """Turn systemd's SIGTERM into SystemExit so main()'s finally block flushes buffered samples"""
+    raise SystemExit(0)
 
-    row.update(sys_data)
-    row.update(arduino_data)
-    row.update({
-        "packet_loss": loss,
-        "ping_avg": ping_avg,
-        "ping_jitter": jitter,
-        "wifi_strength": wifi_strength
-    })
-
-    # Clip features to training ranges
-    for f in feature_order:
-        if row[f] is None:
-            row[f] = 0
-        else:
-            min_val, max_val = feature_clip_ranges[f]
-            row[f] = min(max(row[f], min_val), max_val)
-
-    # Convert to DataFrame in correct order
-    df_row = pd.DataFrame([row], columns=feature_order)
-
-    # Scale and predict
-    X_scaled = scaler.transform(df_row.values)
-    pred = model.predict(X_scaled)
-    is_anomaly = int(pred[0] == -1)
-
-    # Determine category
-    category = categorize_anomaly(df_row.iloc[0]) if is_anomaly else "Normal"
-
-    # Prepare Firebase document
-    firebase_data = {
-        "timestamp": firestore.SERVER_TIMESTAMP,
-        "is_anomaly": is_anomaly,
-        "category": category,
-        **df_row.iloc[0].to_dict()
-    }
+def main():
+    signal.signal(signal.SIGTERM, _handle_sigterm)
+    threading.Thread(target=serial_reader, daemon=True).start()
+    last_hash = None
+    last_upload_ts = 0.0
+    next_tick = time.monotonic()
+    try:
+        while True:
+            # Read all metrics (the Arduino is read while the slow probes run)
+            fut_ping = sensor_executor.submit(ping_test)
+            fut_wifi = sensor_executor.submit(get_wifi_strength)
+            fut_sys = sensor_executor.submit(collect_system_metrics)
+            arduino_data = read_arduino_data() or {}
+            ping_avg, loss, jitter = fut_ping.result()
+            wifi_strength = fut_wifi.result()
+            sys_data = fut_sys.result()
+
+            # Fill the model input buffer in place (missing readings as NaN)
+            _row_buf.fill(np.nan)
+            store_readings(sys_data.items())
+            store_readings(arduino_data.items())
+            store_readings((
+                ("packet_loss", loss),
+                ("ping_avg", ping_avg),
+                ("ping_jitter", jitter),
+                ("wifi_strength", wifi_strength)
+            ))
+            # Clip, zero-fill, scale and categorize in one compiled pass, then predict
+            category_code = process_row()
+            pred = predict_labels(_scaled_buf)
+            is_anomaly = int(pred[0] == -1)
+            category = CATEGORIES[category_code] if is_anomaly else "Normal"
+
+            # Skip the upload if nothing changed since the last one (apart from heartbeats)
+            sample_hash = hash((_row_buf.tobytes(), is_anomaly))
+            now = time.monotonic()
+            if sample_hash != last_hash or now - last_upload_ts >= HEARTBEAT_SEC:
+                queue_sample(is_anomaly, category)
+                last_hash = sample_hash
+                last_upload_ts = now
+            flush_if_stale()
 
-    # Upload
-    db.collection(firebase_collection).add(firebase_data)
-    print("Uploaded anomaly status:", firebase_data)
+            next_tick += SAMPLE_INTERVAL
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -SAMPLE_INTERVAL:
+                # Fell more than a full interval behind; resync rather than burst to catch up
+                next_tick = time.monotonic()
+    finally:
+        # Don't lose buffered samples on shutdown
+        flush_pending()
+        upload_executor.shutdown(wait=True)
+        sensor_executor.shutdown(wait=False)
 
-    time.sleep(10)
+if __name__ == "__main__":
+    main()
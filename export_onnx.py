@@ -0,0 +1,27 @@
+# ==========================================
+# Convert the trained IsolationForest to ONNX (run once, offline)
+# ==========================================
+# Usage: python export_onnx.py [anomaly_detector.pkl] [anomaly_detector.onnx]
+# Copy the output next to the .pkl on the Pi; active_testing.py picks it up
+# automatically when onnxruntime is installed.
+
+import sys
+
+import joblib
+from skl2onnx import convert_sklearn
+from skl2onnx.common.data_types import FloatTensorType
+
+src = sys.argv[1] if len(sys.argv) > 1 else "anomaly_detector.pkl"
+dst = sys.argv[2] if len(sys.argv) > 2 else "anomaly_detector.onnx"
+
+model = joblib.load(src)
+onnx_model = convert_sklearn(
+    model,
+    initial_types=[("X", FloatTensorType([None, model.n_features_in_]))],
+    # IsolationForest needs the ai.onnx.ml TreeEnsemble operators from opset 3
+    target_opset={"": 17, "ai.onnx.ml": 3}
+)
+
+with open(dst, "wb") as f:
+    f.write(onnx_model.SerializeToString())
+print(f"Wrote {dst}")
@@ -1,3 +1,5 @@
+import os
+import selectors
 import serial
 import time
 
@@ -5,21 +7,46 @@ ser_acm0 = serial.Serial('/dev/ttyACM0', 9600, timeout=1)
 ser_acm1 = serial.Serial('/dev/ttyACM1', 9600, timeout=1)
 time.sleep(2)
 
+# Block until either port has data instead of polling
+sel = selectors.DefaultSelector()
+sel.register(ser_acm0.fileno(), selectors.EVENT_READ, ("ACM0", ser_acm1))
+sel.register(ser_acm1.fileno(), selectors.EVENT_READ, ("ACM1", None))
+
+# Debug output is throttled so logging never becomes the bottleneck
+LOG_INTERVAL = 1.0
+forwarded_bytes = 0
+last_log = time.monotonic()
+last_sent = b""
+last_reply = b""
+
 print("Bridge started: ACM0 -> ACM1")
 
 while True:
-    # Read from ACM0
-    if ser_acm0.in_waiting > 0:
-        line = ser_acm0.readline().decode('utf-8', errors='ignore').strip()
-        print(f"ACM0 sent: {line}")
-        
-        # Forward to ACM1
-        ser_acm1.write((line + '\n').encode('utf-8'))
-        print(f"Forwarded to ACM1: {line}")
-    
-    # Optional: Read response from ACM1
-    if ser_acm1.in_waiting > 0:
-        response = ser_acm1.readline().decode('utf-8', errors='ignore').strip()
-        print(f"ACM1 replied: {response}")
-    
-    time.sleep(0.1)
+    for key, _ in sel.select(timeout=LOG_INTERVAL):
+        name, forward_port = key.data
+        try:
+            data = os.read(key.fd, 4096)
+        except BlockingIOError:
+            continue
+        if not data:
+            raise SystemExit(f"{name} disconnected")
+
+        if forward_port is None:
+            # Response from ACM1
+            last_reply = data
+            continue
+
+        # Forward raw bytes from ACM0 to ACM1; Serial.write retries short writes on the non-blocking port
+        forward_port.write(data)
+        forwarded_bytes += len(data)
+        last_sent = data
+
+    now = time.monotonic()
+    if now - last_log >= LOG_INTERVAL:
+        if forwarded_bytes:
+            print(f"Forwarded {forwarded_bytes} bytes ACM0 -> ACM1, last: {last_sent!r}")
+        if last_reply:
+            print(f"ACM1 replied: {last_reply!r}")
+        forwarded_bytes = 0
+        last_reply = b""
+        last_log = now
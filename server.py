@@ -1,14 +1,24 @@
 import asyncio
+import functools
+import hashlib
 import json
 from datetime import datetime, timedelta
+from collections.abc import Mapping
+from types import MappingProxyType
 from typing import Any
 import random
+import operator
+import re
+import bisect
 import time
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import firebase_admin
 from firebase_admin import credentials, firestore
 import anthropic
+import httpx
 
 from mcp.server import Server
 from mcp.server.stdio import stdio_server
@@ -17,75 +27,370 @@ from mcp.types import Tool, TextContent
 from datetime import datetime, timezone
 
 from google.cloud.firestore_v1.base_query import FieldFilter
+from google.api_core.exceptions import FailedPrecondition
 
-# Initialize Firebase with error handling
-db = None
 try:
-    cred = credentials.Certificate('firebase.json')
-    firebase_app = firebase_admin.initialize_app(cred)
-    db = firestore.client()
-    client = anthropic.Anthropic(api_key="redacted")
+    import orjson
+except ImportError:
+    orjson = None  # fall back to the stdlib encoder
 
-    print("Firebase initialized successfully", file=sys.stderr, flush=True)
-except Exception as e:
-    print(f"Warning: Firebase initialization failed: {e}", file=sys.stderr, flush=True)
-    print("Server will continue with in-memory storage only", file=sys.stderr, flush=True)
+try:
+    import h2
+except ImportError:
+    h2 = None  # httpx can only speak HTTP/2 with the h2 package
+
+# Firebase is initialized on first use so server startup doesn't wait on the handshake
+_db = None
+_db_initialized = False
+_db_lock = threading.Lock()
+
+def _get_db():
+    """Initialize Firebase once and return the Firestore client, or None if it is unavailable"""
+    global _db, _db_initialized
+    if _db_initialized:
+        return _db
+    
+    # Tool handlers call this from worker threads, so only one of them may initialize the app
+    with _db_lock:
+        if _db_initialized:
+            return _db
+        try:
+            cred = credentials.Certificate('firebase.json')
+            firebase_admin.initialize_app(cred)
+            _db = firestore.client()
+            print("Firebase initialized successfully", file=sys.stderr, flush=True)
+        except Exception as e:
+            print(f"Warning: Firebase initialization failed: {e}", file=sys.stderr, flush=True)
+            print("Server will continue with in-memory storage only", file=sys.stderr, flush=True)
+        _db_initialized = True
+    return _db
+
+# Document references are reused across calls; callers make sure _get_db() is not None first
+@functools.lru_cache(maxsize=4096)
+def _request_ref(request_id):
+    """Cached reference to an ai_requests document"""
+    return _get_db().collection('ai_requests').document(request_id)
+
+@functools.lru_cache(maxsize=4096)
+def _device_ref(device_id):
+    """Cached reference to a devices document"""
+    return _get_db().collection("devices").document(device_id)
+
+# One pooled HTTP client keeps TLS connections alive across concurrent AI requests (multiplexed over HTTP/2 when available)
+_http_client = httpx.Client(
+    http2=h2 is not None,
+    limits=httpx.Limits(max_connections=32, max_keepalive_connections=32),
+    timeout=60.0
+)
+client = anthropic.Anthropic(api_key="redacted", http_client=_http_client)
 
 # Initialize MCP server
 app = Server("home-network-copilot")
 
-# Fallback devices if Firestore is empty
-DEFAULT_DEVICES = {
-    "router": {"type": "gateway", "location": "office", "status": "online"},
-    "living_room_tv": {"type": "streaming", "location": "living_room", "status": "online"},
-    "office_pc": {"type": "workstation", "location": "office", "status": "online"}
-}
+def _json_default(obj):
+    """Serialize values the JSON encoders don't handle natively (e.g. Firestore timestamps)"""
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    return str(obj)
+
+# Response timestamps are shared by every call within the same 100ms window
+_TS_BUCKET_NS = 100_000_000
+_ts_cache = (-1, None)
+
+def _utcnow():
+    """Return the current UTC time, refreshed at most once per _TS_BUCKET_NS"""
+    global _ts_cache
+    bucket = time.monotonic_ns() // _TS_BUCKET_NS
+    if bucket != _ts_cache[0]:
+        _ts_cache = (bucket, datetime.now(timezone.utc))
+    return _ts_cache[1]
+
+# Responses are read by MCP clients rather than people, so JSON is sent without whitespace
+_JSON_SEPARATORS = (",", ":")
+
+def _dumps(data):
+    """Serialize a tool response as compact JSON, using orjson when installed"""
+    if orjson is not None:
+        return orjson.dumps(
+            data,
+            default=_json_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_NAIVE_UTC
+        ).decode()
+    return json.dumps(data, separators=_JSON_SEPARATORS, default=_json_default)
+
+def _text(body):
+    """Wrap a response string as a tool result, skipping pydantic validation of the known-good fields"""
+    return [TextContent.model_construct(type="text", text=body)]
+
+# Fallback devices if Firestore is empty (read-only, since it is shared by every response)
+DEFAULT_DEVICES = MappingProxyType({
+    "router": MappingProxyType({"type": "gateway", "location": "office", "status": "online"}),
+    "living_room_tv": MappingProxyType({"type": "streaming", "location": "living_room", "status": "online"}),
+    "office_pc": MappingProxyType({"type": "workstation", "location": "office", "status": "online"})
+})
+
+# Device snapshot reused across tool calls for a short time
+DEVICES_CACHE_TTL = 30  # seconds
+# (devices, online IDs, monotonic time) swapped as one tuple, since the listener thread writes it while workers read it
+_devices_snapshot = (None, frozenset(), 0.0)
+# Watch started by watch_devices(); while it runs the snapshot is kept current and the TTL doesn't apply
+_devices_watch = None
+
+def _online_ids(devices):
+    """IDs of devices whose status is online"""
+    return frozenset(device_id for device_id, d in devices.items() if d.get("status") == "online")
+
+_DEFAULT_ONLINE_COUNT = len(_online_ids(DEFAULT_DEVICES))
+
+def _devices_listener_active():
+    """Whether the devices listener is still streaming change events"""
+    return _devices_watch is not None and _devices_watch.is_active
+
+def _fresh_devices_snapshot():
+    """The cached (devices, online IDs, time) snapshot if it can still be served, else None"""
+    snapshot = _devices_snapshot
+    devices, _, ts = snapshot
+    if devices is None:
+        return None
+    if _devices_listener_active() or time.monotonic() - ts < DEVICES_CACHE_TTL:
+        return snapshot
+    return None
+
+def _store_devices(devices):
+    """Cache a fresh devices snapshot (or the defaults if it is empty) and return it"""
+    global _devices_snapshot
+    devices = devices if devices else DEFAULT_DEVICES
+    _devices_snapshot = (devices, _online_ids(devices), time.monotonic())
+    return devices
 
 def get_devices_from_db():
-    """Get devices from Firestore or return defaults"""
+    """Get devices from Firestore (cached while the listener runs, else for DEVICES_CACHE_TTL seconds) or return defaults"""
+    db = _get_db()
     if db is None:
         return DEFAULT_DEVICES
     
+    snapshot = _fresh_devices_snapshot()
+    if snapshot is not None:
+        return snapshot[0]
+    
     try:
         devices_ref = db.collection("devices").stream()
-        devices = {doc.id: doc.to_dict() for doc in devices_ref}
-        return devices if devices else DEFAULT_DEVICES
+        return _store_devices({doc.id: doc.to_dict() for doc in devices_ref})
     except Exception as e:
         print(f"Error fetching devices: {e}", file=sys.stderr, flush=True)
         return DEFAULT_DEVICES
 
-def log_network_status(status_data):
-    """Log network status to Firestore"""
+def get_device_statuses():
+    """Get {device_id: status} from Firestore, fetching only the status field"""
+    db = _get_db()
+    try:
+        docs = db.collection("devices").select(["status"]).stream()
+        return {doc.id: (doc.to_dict() or {}).get("status") for doc in docs}
+    except Exception as e:
+        print(f"Error fetching device statuses: {e}", file=sys.stderr, flush=True)
+        return {}
+
+def get_online_device_count():
+    """Get the number of online devices, reusing the count stored with the cached snapshot"""
+    db = _get_db()
     if db is None:
+        return _DEFAULT_ONLINE_COUNT
+    
+    snapshot = _fresh_devices_snapshot()
+    if snapshot is not None:
+        return len(snapshot[1])
+    
+    # Let Firestore count without streaming every device document
+    try:
+        query = db.collection("devices").where(filter=FieldFilter("status", "==", "online"))
+        online = query.count().get()[0][0].value
+        if online:
+            return online
+        # Zero may mean an empty collection, in which case the defaults apply
+    except Exception as e:
+        print(f"Error counting online devices: {e}", file=sys.stderr, flush=True)
+    
+    # Only the status field is needed, so skip decoding the full device documents
+    statuses = get_device_statuses()
+    if not statuses:
+        return _DEFAULT_ONLINE_COUNT
+    return sum(1 for status in statuses.values() if status == "online")
+
+def invalidate_devices_cache():
+    """Force the next get_devices_from_db() call to re-read Firestore, unless the listener will deliver the change"""
+    global _devices_snapshot
+    if _devices_listener_active():
+        return
+    devices, online_ids, _ = _devices_snapshot
+    _devices_snapshot = (devices, online_ids, 0.0)
+
+# Writes from tool handlers are queued here and applied by _firestore_writer() (both created in main)
+_write_queue = None
+
+# Network logs are committed in batches of up to LOG_BATCH_SIZE, at most LOG_FLUSH_INTERVAL seconds late
+LOG_BATCH_SIZE = 50
+LOG_FLUSH_INTERVAL = 5.0
+
+# Device metric updates arriving within METRICS_FLUSH_INTERVAL seconds are committed together, newest per device
+METRICS_FLUSH_INTERVAL = 0.1
+
+def log_network_status(status_data):
+    """Queue a network status log for the background Firestore writer"""
+    if _write_queue is not None:
+        _write_queue.put_nowait(("log", status_data))
+        return
+    
+    # No writer running (not started through main), so write directly
+    if _get_db() is None:
         print("Skipping Firestore log (DB not initialized)", file=sys.stderr, flush=True)
         return
+    _commit_network_logs([status_data])
+
+def update_device_metrics(device_id, metrics):
+    """Queue a device metrics update for the background Firestore writer"""
+    if _write_queue is not None:
+        _write_queue.put_nowait(("metrics", device_id, metrics))
+        return
     
+    # No writer running (not started through main), so write directly
+    if _get_db() is None:
+        print("Skipping device metrics update (DB not initialized)", file=sys.stderr, flush=True)
+        return
+    _write_device_metrics({device_id: metrics})
+
+def _commit_network_logs(entries):
+    """Log network statuses to Firestore in a single batch"""
+    db = _get_db()
     try:
-        db.collection("network_logs").add({
-            **status_data,
+        logs_ref = db.collection("network_logs")
+        batch = db.batch()
+        for status_data in entries:
+            batch.set(logs_ref.document(), {
+                **status_data,
+                "logged_at": firestore.SERVER_TIMESTAMP
+            })
+        # Keep a single "latest" document current so readers don't need an ordered query
+        batch.set(db.collection("state").document("latest"), {
+            **entries[-1],
             "logged_at": firestore.SERVER_TIMESTAMP
         })
+        batch.commit()
+        _latest_log_cache["ts"] = 0.0
     except Exception as e:
         print(f"Error logging to Firestore: {e}", file=sys.stderr, flush=True)
 
-def update_device_metrics(device_id, metrics):
-    """Update device metrics in Firestore"""
-    if db is None:
-        print("Skipping device metrics update (DB not initialized)", file=sys.stderr, flush=True)
-        return
-    
+def _write_device_metrics(updates):
+    """Update device metrics in Firestore in a single batch, given {device_id: metrics}"""
+    db = _get_db()
     try:
-        device_ref = db.collection("devices").document(device_id)
-        device_ref.set({
-            "last_checked": firestore.SERVER_TIMESTAMP,
-            "metrics": metrics
-        }, merge=True)
+        batch = db.batch()
+        for device_id, metrics in updates.items():
+            batch.set(_device_ref(device_id), {
+                "last_checked": firestore.SERVER_TIMESTAMP,
+                "metrics": metrics
+            }, merge=True)
+        batch.commit()
+        invalidate_devices_cache()
     except Exception as e:
         print(f"Error updating device metrics: {e}", file=sys.stderr, flush=True)
 
+async def _firestore_writer():
+    """Apply queued Firestore writes in a worker thread so tool calls never wait on them"""
+    loop = asyncio.get_running_loop()
+    db_ready = False
+    logs = []
+    logs_flush_at = None
+    metrics = {}
+    metrics_flush_at = None
+    try:
+        # Writes queue up from the first tool call; connecting here keeps the handshake off the event loop
+        db_ready = await asyncio.to_thread(_get_db) is not None
+        while True:
+            deadlines = [t for t in (logs_flush_at, metrics_flush_at) if t is not None]
+            timeout = max(0.0, min(deadlines) - loop.time()) if deadlines else None
+            try:
+                kind, *args = await asyncio.wait_for(_write_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                kind = None
+            
+            if not db_ready:
+                if kind == "log":
+                    print("Skipping Firestore log (DB not initialized)", file=sys.stderr, flush=True)
+                elif kind == "metrics":
+                    print("Skipping device metrics update (DB not initialized)", file=sys.stderr, flush=True)
+                continue
+            
+            if kind == "log":
+                logs.append(args[0])
+                if logs_flush_at is None:
+                    logs_flush_at = loop.time() + LOG_FLUSH_INTERVAL
+            elif kind == "metrics":
+                device_id, device_metrics = args
+                metrics[device_id] = device_metrics
+                if metrics_flush_at is None:
+                    metrics_flush_at = loop.time() + METRICS_FLUSH_INTERVAL
+            
+            # Buffers are swapped out before awaiting, so a cancellation mid-commit can't write them twice
+            if metrics and loop.time() >= metrics_flush_at:
+                pending_metrics, metrics, metrics_flush_at = metrics, {}, None
+                await asyncio.to_thread(_write_device_metrics, pending_metrics)
+            
+            if logs and (len(logs) >= LOG_BATCH_SIZE or loop.time() >= logs_flush_at):
+                pending_logs, logs, logs_flush_at = logs, [], None
+                await asyncio.to_thread(_commit_network_logs, pending_logs)
+    finally:
+        # On shutdown, write whatever is still buffered or queued before the loop goes away
+        if db_ready:
+            while not _write_queue.empty():
+                kind, *args = _write_queue.get_nowait()
+                if kind == "log":
+                    logs.append(args[0])
+                elif kind == "metrics":
+                    metrics[args[0]] = args[1]
+            if metrics:
+                _write_device_metrics(metrics)
+            for start in range(0, len(logs), LOG_BATCH_SIZE):
+                _commit_network_logs(logs[start:start + LOG_BATCH_SIZE])
+
+
+AI_MODEL = "claude-sonnet-4-5-20250929"
+
+# Cached answers older than this are regenerated, so advice doesn't go stale indefinitely
+AI_CACHE_MAX_AGE = timedelta(days=1)
+
+# AI requests are I/O-bound (Claude API plus Firestore), capped to stay clear of gRPC deadline errors
+AI_REQUEST_WORKERS = 10
+_ai_executor = ThreadPoolExecutor(max_workers=AI_REQUEST_WORKERS)
+
+def _report_ai_request_failure(request_id, future):
+    """Done-callback that logs an exception escaping process_ai_request instead of letting it vanish"""
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Processing AI request {request_id} failed: {future.exception()!r}", file=sys.stderr, flush=True)
+
+# Most pending requests handled by one process_pending_requests() sweep
+PENDING_BATCH_SIZE = 50
+
+def watch_devices():
+    """Keep the devices cache current from Firestore change events"""
+    global _devices_watch
+    db = _get_db()
+    if db is None:
+        print("Cannot watch devices (DB not initialized)", file=sys.stderr, flush=True)
+        return
+    
+    print("Starting to watch devices...", file=sys.stderr, flush=True)
+    
+    # Every snapshot carries the full collection, so the cache is simply replaced
+    def on_snapshot(col_snapshot, changes, read_time):
+        _store_devices({doc.id: doc.to_dict() for doc in col_snapshot})
+    
+    _devices_watch = db.collection('devices').on_snapshot(on_snapshot)
 
 def watch_ai_requests():
     """Watch for pending AI requests and process them"""
+    db = _get_db()
     if db is None:
         print("Cannot watch AI requests (DB not initialized)", file=sys.stderr, flush=True)
         return
@@ -99,18 +404,89 @@ def watch_ai_requests():
                 doc = change.document
                 data = doc.to_dict()
                 
-                # Only process if status is pending
+                # Only process if status is pending; hand off so the listener thread keeps delivering snapshots
                 if data.get('status') == 'pending':
                     print(f"Processing AI request: {doc.id}", file=sys.stderr, flush=True)
-                    process_ai_request(doc.id, data)
+                    future = _ai_executor.submit(process_ai_request, doc.id, data)
+                    future.add_done_callback(functools.partial(_report_ai_request_failure, doc.id))
     
     # Set up the listener
     query = db.collection('ai_requests').where(
     filter=FieldFilter('status', '==', 'pending'))
     query.on_snapshot(on_snapshot)
 
+def _ai_cache_key(prompt):
+    """Content address of a Claude answer: model and prompt, NUL-separated"""
+    digest = hashlib.sha256()
+    for part in (AI_MODEL, prompt):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def _read_ai_cache(cache_ref):
+    """Return a stored (response, suggestions) pair, or None if the entry is missing, incomplete or older than AI_CACHE_MAX_AGE"""
+    cached = cache_ref.get()
+    if not cached.exists:
+        return None
+    
+    hit = cached.to_dict() or {}
+    response = hit.get("response")
+    suggestions = hit.get("suggestions")
+    created_at = hit.get("created_at")
+    if not isinstance(response, str) or not isinstance(suggestions, list) or not isinstance(created_at, datetime):
+        return None
+    if datetime.now(timezone.utc) - created_at > AI_CACHE_MAX_AGE:
+        return None
+    return response, suggestions
+
+def ask_claude(prompt):
+    """Stream a Claude reply, extracting suggestions from each finished line while the rest is generated"""
+    chunks = []
+    partial_line = ""
+    suggestions = []
+    with client.messages.stream(
+        model=AI_MODEL,
+        max_tokens=4096,
+        messages=[{
+            "role": "user",
+            "content": prompt
+        }]
+    ) as stream:
+        for text in stream.text_stream:
+            chunks.append(text)
+            if "\n" in text:
+                finished, _, partial_line = (partial_line + text).rpartition("\n")
+                _collect_suggestions(finished, suggestions)
+            else:
+                partial_line += text
+        message = stream.get_final_message()
+    _collect_suggestions(partial_line, suggestions)
+    
+    return "".join(chunks), suggestions, message.usage.input_tokens + message.usage.output_tokens
+
+# Requests currently being processed; a request stays "pending" for the whole Claude call,
+# so the listener and a manual sweep can both pick it up
+_in_flight_requests = set()
+_in_flight_lock = threading.Lock()
+
 def process_ai_request(request_id, request_data):
+    """Process a single AI request unless it is already in flight, returning whether it was handled here"""
+    with _in_flight_lock:
+        if request_id in _in_flight_requests:
+            print(f"Request {request_id} is already being processed", file=sys.stderr, flush=True)
+            return False
+        _in_flight_requests.add(request_id)
+    
+    try:
+        _run_ai_request(request_id, request_data)
+    finally:
+        with _in_flight_lock:
+            _in_flight_requests.discard(request_id)
+    return True
+
+def _run_ai_request(request_id, request_data):
     """Process a single AI request"""
+    db = _get_db()
     if db is None or client is None:
         print("Cannot process AI request (DB or client not initialized)", file=sys.stderr, flush=True)
         return
@@ -130,26 +506,21 @@ def process_ai_request(request_id, request_data):
         if not prompt:
             raise ValueError("No prompt found in request")
         
-        print(f"Sending prompt to Claude API...", file=sys.stderr, flush=True)
-        
-        # Call Claude API
-        message = client.messages.create(
-            model="claude-sonnet-4-5-20250929",
-            max_tokens=4096,
-            messages=[{
-                "role": "user",
-                "content": prompt
-            }]
-        )
+        # Identical prompts reuse the stored answer instead of calling Claude again
+        cache_ref = db.collection('ai_cache').document(_ai_cache_key(prompt))
+        cache_hit = _read_ai_cache(cache_ref)
+        if cache_hit is not None:
+            ai_response, suggestions = cache_hit
+            tokens_used = 0
+            print(f"Reusing cached response for request {request_id}", file=sys.stderr, flush=True)
+        else:
+            print(f"Sending prompt to Claude API...", file=sys.stderr, flush=True)
+            ai_response, suggestions, tokens_used = ask_claude(prompt)
         
-        ai_response = message.content[0].text
         processing_time_ms = int((time.time() - start_time) * 1000)
         
-        print(f"Received response from Claude ({processing_time_ms}ms)", file=sys.stderr, flush=True)
-        
-        # Extract suggestions from response
-        suggestions = extract_suggestions(ai_response)
-    
+        if cache_hit is None:
+            print(f"Received response from Claude ({processing_time_ms}ms)", file=sys.stderr, flush=True)
         
         # Write response to ai_responses collection
         response_doc = {
@@ -161,18 +532,31 @@ def process_ai_request(request_id, request_data):
             "error": None,
             "suggestions": suggestions,
             "metadata": {
-                "model": "claude-sonnet-4-5-20250929",
+                "model": AI_MODEL,
                 "processing_time_ms": processing_time_ms,
-                "tokens_used": message.usage.input_tokens + message.usage.output_tokens,
+                "tokens_used": tokens_used,
+                "cached": cache_hit is not None,
                 "request_type": request_data.get('request_type', 'general_query')
             }
         }
         
-        db.collection('ai_responses').add(response_doc)
+        # Write the response and mark the original request completed in one commit
+        batch = db.batch()
+        if cache_hit is None:
+            # Also replaces expired or incomplete entries
+            batch.set(cache_ref, {
+                "response": ai_response,
+                "suggestions": suggestions,
+                "model": AI_MODEL,
+                "created_at": firestore.SERVER_TIMESTAMP
+            })
+        batch.set(db.collection('ai_responses').document(), response_doc)
+        batch.update(_request_ref(request_id), {
+            "status": "completed",
+            "updated_at": firestore.SERVER_TIMESTAMP
+        })
+        batch.commit()
         print(f"Wrote response to ai_responses collection", file=sys.stderr, flush=True)
-        
-        # Update original request status to completed
-        update_request_status(request_id, 'completed')
         print(f"Request {request_id} completed successfully", file=sys.stderr, flush=True)
         
     except Exception as e:
@@ -194,51 +578,73 @@ def process_ai_request(request_id, request_data):
             }
         }
         
-        db.collection('ai_responses').add(error_doc)
-        
-        # Update request with error status and increment retry count
-        db.collection('ai_requests').document(request_id).update({
+        # Write the error response and update the request (error status, retry count) in one commit
+        batch = db.batch()
+        batch.set(db.collection('ai_responses').document(), error_doc)
+        batch.update(_request_ref(request_id), {
             "status": "failed",
             "retry_count": firestore.Increment(1),
             "last_error": error_msg,
             "updated_at": firestore.SERVER_TIMESTAMP
         })
+        batch.commit()
+
+def _pending_request_docs(db):
+    """Up to PENDING_BATCH_SIZE pending AI requests, oldest first when the composite index exists"""
+    pending = db.collection('ai_requests').where(filter=FieldFilter('status', '==', 'pending'))
+    try:
+        # Served by the (status, timestamp) index declared in firestore.indexes.json; every writer sets timestamp
+        return list(pending.order_by('timestamp').limit(PENDING_BATCH_SIZE).stream())
+    except FailedPrecondition as e:
+        print(f"ai_requests (status, timestamp) index missing, sweeping unordered: {e}", file=sys.stderr, flush=True)
+        return list(pending.limit(PENDING_BATCH_SIZE).stream())
+
+def process_pending_requests():
+    """Process up to PENDING_BATCH_SIZE pending AI requests concurrently and return how many were handled"""
+    db = _get_db()
+    pending = _pending_request_docs(db)
+    
+    # Each request waits seconds on the Claude API, so run them side by side
+    results = _ai_executor.map(lambda doc: process_ai_request(doc.id, doc.to_dict()), pending)
+    return sum(1 for handled in results if handled)
 
 def update_request_status(request_id, status):
     """Update the status of an AI request"""
+    db = _get_db()
     if db is None:
         return
     
     try:
-        db.collection('ai_requests').document(request_id).update({
+        _request_ref(request_id).update({
             "status": status,
             "updated_at": firestore.SERVER_TIMESTAMP
         })
     except Exception as e:
         print(f"Error updating request status: {e}", file=sys.stderr, flush=True)
 
-def extract_suggestions(response_text):
-    """Extract actionable suggestions from AI response"""
-    suggestions = []
-    lines = response_text.split('\n')
-    
-    for line in lines:
-        # Match numbered lists, bullets, or lines with action words
-        stripped = line.strip()
-        if stripped and (
-            stripped[0].isdigit() or 
-            stripped.startswith(('-', '*', '•')) or
-            any(word in stripped.lower() for word in ['try', 'check', 'enable', 'disable', 'restart', 'update'])
-        ):
-            # Cleaning the line
-            cleaned = stripped.lstrip('0123456789.-*• ')
-            if len(cleaned) > 10:  # Ignore very short lines
-                suggestions.append(cleaned)
-    
-    return suggestions[:5]  # Return top 5 suggestions
+# Suggestion lines: numbered, bulleted, or containing an action word; group 1 is the line minus its list marker
+_SUGGESTION_LINE = re.compile(
+    r"^[^\S\n]*(?=[\d\-*•]|.*?(?:try|check|enable|disable|restart|update))[0-9.\-*• ]*(.*?)[^\S\n]*$",
+    re.IGNORECASE | re.MULTILINE
+)
+
+MAX_SUGGESTIONS = 5
+
+def _collect_suggestions(text, suggestions):
+    """Append suggestions found in complete lines of text until there are MAX_SUGGESTIONS"""
+    if len(suggestions) >= MAX_SUGGESTIONS:
+        return
+    
+    for match in _SUGGESTION_LINE.finditer(text):
+        cleaned = match.group(1)
+        if len(cleaned) > 10:  # Ignore very short lines
+            suggestions.append(cleaned)
+            if len(suggestions) == MAX_SUGGESTIONS:
+                break
 
 def get_latest_ai_request():
     """Get the latest AI request from Firestore"""
+    db = _get_db()
     if db is None:
         return {}
     
@@ -260,6 +666,7 @@ def get_latest_ai_request():
 
 def get_latest_ai_response():
     """Get the latest AI response from Firestore"""
+    db = _get_db()
     if db is None:
         return {}
     
@@ -279,307 +686,394 @@ def get_latest_ai_response():
         print(f"Error reading ai response logs: {e}", file=sys.stderr, flush=True)
         return {}
 
+# Latest network log reused by bursts of dashboard calls
+LATEST_LOG_CACHE_TTL = 0.5  # seconds
+_latest_log_cache = {"data": None, "ts": 0.0}
+
+def get_latest_network_log():
+    """Get the dashboard fields of the latest network log from Firestore (cached for LATEST_LOG_CACHE_TTL seconds)"""
+    db = _get_db()
+    if db is None:
+        return {}
+    
+    if _latest_log_cache["data"] is not None and time.monotonic() - _latest_log_cache["ts"] < LATEST_LOG_CACHE_TTL:
+        return _latest_log_cache["data"]
+    
+    try:
+        # Point read of the copy _commit_network_logs keeps of the newest log
+        latest = db.collection("state").document("latest").get(field_paths=_DASHBOARD_FIELDS)
+        if latest.exists:
+            data = latest.to_dict()
+        else:
+            # Nothing materialized yet (no logs since upgrading), so query the log collection
+            network_logs = db.collection("network_logs").select(_DASHBOARD_FIELDS).order_by(
+                "logged_at", direction=firestore.Query.DESCENDING
+            ).limit(1).stream()
+            
+            latest_network = next(network_logs, None)
+            data = latest_network.to_dict() if latest_network else {}
+        
+        _latest_log_cache["data"] = data
+        _latest_log_cache["ts"] = time.monotonic()
+        return data
+    except Exception as e:
+        print(f"Error reading network logs: {e}", file=sys.stderr, flush=True)
+        return {}
+
+# Tool definitions never change, so they are built once at import
+_TOOLS = [
+    Tool(
+        name="get_network_status",
+        description="Get current network status including signal strength and device count",
+        inputSchema={
+            "type": "object",
+            "properties": {},
+            "required": []
+        }
+    ),
+    Tool(
+        name="get_device_metrics",
+        description="Get detailed metrics for a specific device",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "device_id": {
+                    "type": "string",
+                    "description": "Device name: router, living_room_tv, office_pc"
+                }
+            },
+            "required": ["device_id"]
+        }
+    ),
+    Tool(
+        name="list_devices",
+        description="List all devices from Firestore database",
+        inputSchema={
+            "type": "object",
+            "properties": {},
+            "required": []
+        }
+    ),
+    Tool(
+        name="diagnose_connection",
+        description="Get troubleshooting recommendations for network issues",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "device_id": {
+                    "type": "string",
+                    "description": "Optional device to diagnose"
+                }
+            },
+            "required": []
+        }
+    ),
+    Tool(
+        name="get_network_health_dashboard",
+        description="Get comprehensive network health score, issues, and recommendations",
+        inputSchema={
+            "type": "object",
+            "properties": {},
+            "required": []
+        }
+    ),
+    Tool(
+        name="get_latest_ai_request",
+        description="Get the most recent AI request from the database",
+        inputSchema={
+            "type": "object",
+            "properties": {},
+            "required": []
+        }
+    ),
+    Tool(
+        name="get_latest_ai_response",
+        description="Get the most recent AI response from the database",
+        inputSchema={
+            "type": "object",
+            "properties": {},
+            "required": []
+        }
+    ),
+    Tool(
+        name="process_pending_requests",
+        description="Manually trigger processing of pending AI requests (up to 50 per call, oldest first)",
+        inputSchema={
+            "type": "object",
+            "properties": {},
+            "required": []
+        }
+    )
+]
+
 @app.list_tools()
 async def list_tools() -> list[Tool]:
     """Define available tools"""
-    return [
-        Tool(
-            name="get_network_status",
-            description="Get current network status including signal strength and device count",
-            inputSchema={
-                "type": "object",
-                "properties": {},
-                "required": []
-            }
-        ),
-        Tool(
-            name="get_device_metrics",
-            description="Get detailed metrics for a specific device",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "device_id": {
-                        "type": "string",
-                        "description": "Device name: router, living_room_tv, office_pc"
-                    }
-                },
-                "required": ["device_id"]
-            }
-        ),
-        Tool(
-            name="list_devices",
-            description="List all devices from Firestore database",
-            inputSchema={
-                "type": "object",
-                "properties": {},
-                "required": []
-            }
-        ),
-        Tool(
-            name="diagnose_connection",
-            description="Get troubleshooting recommendations for network issues",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "device_id": {
-                        "type": "string",
-                        "description": "Optional device to diagnose"
-                    }
-                },
-                "required": []
-            }
-        ),
-        Tool(
-            name="get_network_health_dashboard",
-            description="Get comprehensive network health score, issues, and recommendations",
-            inputSchema={
-                "type": "object",
-                "properties": {},
-                "required": []
-            }
-        ),
-        Tool(
-            name="get_latest_ai_request",
-            description="Get the most recent AI request from the database",
-            inputSchema={
-                "type": "object",
-                "properties": {},
-                "required": []
-            }
-        ),
-        Tool(
-            name="get_latest_ai_response",
-            description="Get the most recent AI response from the database",
-            inputSchema={
-                "type": "object",
-                "properties": {},
-                "required": []
-            }
-        ),
-        Tool(
-            name="process_pending_requests",
-            description="Manually trigger processing of all pending AI requests",
-            inputSchema={
-                "type": "object",
-                "properties": {},
-                "required": []
-            }
-        )
+    return _TOOLS
+
+class _MetricPool:
+    """Random picks from a fixed set of values, drawn in blocks to amortize per-call RNG overhead"""
+    
+    def __init__(self, values, size=1024):
+        self._values = values
+        self._size = size
+        self._buf = []
+    
+    def next(self):
+        if not self._buf:
+            self._buf = random.choices(self._values, k=self._size)
+        return self._buf.pop()
+
+# Simulated readings used when no real measurement is available
+_METRIC_POOLS = {
+    "5g_signal": _MetricPool(range(70, 95 + 1)),
+    "sessions_today": _MetricPool(range(0, 5 + 1)),
+    "ping_ms": _MetricPool(range(20, 50 + 1)),
+    "jitter_ms": _MetricPool(range(1, 5 + 1)),
+    "download_mbps": _MetricPool(range(25, 100 + 1)),
+    "upload_mbps": _MetricPool(range(10, 50 + 1)),
+    "wifi_rssi_dbm": _MetricPool(range(-70, -50 + 1)),
+    "temperature_c": _MetricPool(range(45, 65 + 1)),
+    "is_active": _MetricPool((True, False)),
+    "data_used_gb": _MetricPool([gb / 100 for gb in range(0, 1200 + 1)]),
+}
+
+# Dashboard metrics in display order: (metric, simulated pool, fixed default when there is no pool)
+_DASHBOARD_FALLBACKS = (
+    ("ping_ms", _METRIC_POOLS["ping_ms"], None),
+    ("jitter_ms", _METRIC_POOLS["jitter_ms"], None),
+    ("download_mbps", _METRIC_POOLS["download_mbps"], None),
+    ("upload_mbps", _METRIC_POOLS["upload_mbps"], None),
+    ("packet_loss_percent", None, 0),
+    ("wifi_rssi_dbm", _METRIC_POOLS["wifi_rssi_dbm"], None),
+    ("temperature_c", _METRIC_POOLS["temperature_c"], None),
+    ("active_devices", None, 3),
+)
+
+# Only these fields are read back from the latest network log
+_DASHBOARD_FIELDS = [key for key, _, _ in _DASHBOARD_FALLBACKS]
+
+# Dashboard health checks: (metric, comparison, threshold, penalty, issue template, recommendation)
+_HEALTH_RULES = (
+    ("ping_ms", operator.gt, 100, 20, "High latency: %sms", "Check for bandwidth-heavy applications"),
+    ("jitter_ms", operator.gt, 10, 15, "High jitter: %sms", "Enable QoS on router"),
+    ("download_mbps", operator.lt, 10, 25, "Low download speed: %sMbps", "Run speed test to verify ISP speed"),
+    ("upload_mbps", operator.lt, 5, 20, "Low upload speed: %sMbps", "Contact ISP if consistently low"),
+    ("packet_loss_percent", operator.gt, 1, 30, "Packet loss: %s%%", "Check cable connections and restart router"),
+    ("wifi_rssi_dbm", operator.lt, -70, 15, "Weak WiFi signal: %sdBm", "Move closer to router or use WiFi extender"),
+    ("temperature_c", operator.gt, 70, 10, "High temperature: %s°C", "Ensure proper ventilation around router"),
+)
+
+def _compile_health_rules(rules):
+    """Generate a straight-line scorer for the rule table, returning (score, issues, recommendations)"""
+    symbols = {operator.gt: ">", operator.lt: "<"}
+    lines = [
+        "def _score_health(current):",
+        "    health_score = 100",
+        "    issues = []",
+        "    recommendations = []",
     ]
+    for key, compare, threshold, penalty, issue, recommendation in rules:
+        lines += [
+            f"    value = current[{key!r}]",
+            f"    if value {symbols[compare]} {threshold!r}:",
+            f"        health_score -= {penalty!r}",
+            f"        issues.append({issue!r} % value)",
+            f"        recommendations.append({recommendation!r})",
+        ]
+    lines.append("    return health_score, issues, recommendations")
+    
+    namespace = {}
+    exec(compile("\n".join(lines), "<health rules>", "exec"), namespace)
+    return namespace["_score_health"]
+
+_score_health = _compile_health_rules(_HEALTH_RULES)
+
+# Dashboard status bands: a score at or above _BAND_KEYS[i] falls in _BAND_VALS[i + 1]
+_BAND_KEYS = (50, 70, 90)
+_BAND_VALS = (
+    ("poor", "Your network has significant issues requiring attention"),
+    ("fair", "Your network has some issues that should be addressed"),
+    ("good", "Your network is performing well"),
+    ("excellent", "Your network is performing optimally!"),
+)
+
+@functools.lru_cache(maxsize=101)
+def _status_summary(health_score):
+    """Status label and summary for a 0-100 health score"""
+    return _BAND_VALS[bisect.bisect_right(_BAND_KEYS, health_score)]
+
+# Firestore calls in handlers are blocking, so they run in worker threads to keep the event loop free
+
+async def _handle_get_network_status(arguments):
+    active_devices = await asyncio.to_thread(get_online_device_count)
+    
+    data = {
+        "timestamp": _utcnow(),
+        "network": {
+            "5g_signal": f"{_METRIC_POOLS['5g_signal'].next()}%",
+        },
+        "active_devices": active_devices,
+        "status": "healthy"
+    }
+    
+    log_network_status(data)
+    return _text(_dumps(data))
+
+async def _handle_get_device_metrics(arguments):
+    device_id = arguments.get("device_id", "")
+    devices = await asyncio.to_thread(get_devices_from_db)
+    
+    if device_id not in devices:
+        available = ", ".join(devices.keys())
+        return _text(f"Device '{device_id}' not found. Available: {available}")
+    
+    metrics = {
+        "is_active": _METRIC_POOLS["is_active"].next(),
+        "sessions_today": _METRIC_POOLS["sessions_today"].next(),
+        "data_used_gb": _METRIC_POOLS["data_used_gb"].next()
+    }
+    
+    data = {
+        "device_id": device_id,
+        "info": devices[device_id],
+        "activity": metrics
+    }
+    
+    update_device_metrics(device_id, metrics)
+    return _text(_dumps(data))
+
+async def _handle_list_devices(arguments):
+    devices_data = await asyncio.to_thread(get_devices_from_db)
+    
+    data = {
+        "timestamp": _utcnow(),
+        "total_devices": len(devices_data),
+        "devices": devices_data,
+        "source": "firestore" if _get_db() else "fallback"
+    }
+    return _text(_dumps(data))
+
+async def _handle_diagnose_connection(arguments):
+    device_id = arguments.get("device_id", "general")
+    
+    data = {
+        "device_id": device_id,
+        "timestamp": _utcnow(),
+        "findings": ["Peak usage detected: 3 devices streaming simultaneously"],
+        "likely_causes": ["Possible interference from neighboring networks"],
+        "recommendations": [
+            "Enable QoS to prioritize video calls over streaming",
+            "Check for firmware updates for router"
+        ],
+        "immediate_actions": [
+            "Reduce streaming quality temporarily",
+            "Check for bandwidth-heavy background updates"
+        ]
+    }
+    return _text(_dumps(data))
+
+async def _handle_get_network_health_dashboard(arguments):
+    # Try to get latest network log from Firestore
+    net = await asyncio.to_thread(get_latest_network_log)
+    
+    # Extract or generate metrics
+    current = {}
+    for key, pool, default in _DASHBOARD_FALLBACKS:
+        if key in net:
+            current[key] = net[key]
+        else:
+            current[key] = pool.next() if pool is not None else default
+    
+    # Calculate health score (0-100)
+    health_score, issues, recommendations = _score_health(current)
+    
+    # Penalties can add up past 100, so floor the score at zero
+    if health_score < 0:
+        health_score = 0
+    
+    status, summary = _status_summary(health_score)
+    
+    # Build dashboard
+    dashboard = {
+        "timestamp": _utcnow(),
+        "health_score": health_score,
+        "status": status,
+        "summary": summary,
+        "current_metrics": current,
+        "issues": issues if issues else ["No issues detected"],
+        "recommendations": recommendations if recommendations else ["No recommendations at this time"]
+    }
+    
+    return _text(_dumps(dashboard))
+
+async def _handle_get_latest_ai_request(arguments):
+    ai_request = await asyncio.to_thread(get_latest_ai_request)
+    return _text(_dumps(ai_request))
+
+async def _handle_get_latest_ai_response(arguments):
+    ai_response = await asyncio.to_thread(get_latest_ai_response)
+    return _text(_dumps(ai_response))
+
+async def _handle_process_pending_requests(arguments):
+    db = await asyncio.to_thread(_get_db)
+    if db is None:
+        return _text("Database not initialized")
+    
+    count = await asyncio.to_thread(process_pending_requests)
+    
+    return _text(f"Processed {count} pending request(s)")
+
+# Tool name -> handler, looked up once per call
+_HANDLERS = {
+    "get_network_status": _handle_get_network_status,
+    "get_device_metrics": _handle_get_device_metrics,
+    "list_devices": _handle_list_devices,
+    "diagnose_connection": _handle_diagnose_connection,
+    "get_network_health_dashboard": _handle_get_network_health_dashboard,
+    "get_latest_ai_request": _handle_get_latest_ai_request,
+    "get_latest_ai_response": _handle_get_latest_ai_response,
+    "process_pending_requests": _handle_process_pending_requests,
+}
 
 @app.call_tool()
 async def call_tool(name: str, arguments: Any) -> list[TextContent]:
     """Handle tool execution"""
-    try:
-        if name == "get_network_status":
-            devices = get_devices_from_db()
-            
-            data = {
-                "timestamp": datetime.now(timezone.utc),
-                "network": {
-                    "5g_signal": f"{random.randint(70, 95)}%",
-                },
-                "active_devices": len([d for d in devices.values() if d.get("status") == "online"]),
-                "status": "healthy"
-            }
-            
-            log_network_status(data)
-            return [TextContent(type="text", text=json.dumps(data, indent=2))]
-        
-        elif name == "get_device_metrics":
-            device_id = arguments.get("device_id", "")
-            devices = get_devices_from_db()
-            
-            if device_id not in devices:
-                available = ", ".join(devices.keys())
-                return [TextContent(
-                    type="text",
-                    text=f"Device '{device_id}' not found. Available: {available}"
-                )]
-            
-            metrics = {
-                "is_active": random.choice([True, False]),
-                "sessions_today": random.randint(0, 5),
-                "data_used_gb": round(random.uniform(0, 12), 2)
-            }
-            
-            data = {
-                "device_id": device_id,
-                "info": devices[device_id],
-                "activity": metrics
-            }
-            
-            update_device_metrics(device_id, metrics)
-            return [TextContent(type="text", text=json.dumps(data, indent=2))]
-        
-        elif name == "list_devices":
-            devices_data = get_devices_from_db()
-            
-            data = {
-                "timestamp": datetime.now(timezone.utc),
-                "total_devices": len(devices_data),
-                "devices": devices_data,
-                "source": "firestore" if db else "fallback"
-            }
-            return [TextContent(type="text", text=json.dumps(data, indent=2))]
-        
-        elif name == "diagnose_connection":
-            device_id = arguments.get("device_id", "general")
-            
-            data = {
-                "device_id": device_id,
-                "timestamp": datetime.now(timezone.utc),
-                "findings": ["Peak usage detected: 3 devices streaming simultaneously"],
-                "likely_causes": ["Possible interference from neighboring networks"],
-                "recommendations": [
-                    "Enable QoS to prioritize video calls over streaming",
-                    "Check for firmware updates for router"
-                ],
-                "immediate_actions": [
-                    "Reduce streaming quality temporarily",
-                    "Check for bandwidth-heavy background updates"
-                ]
-            }
-            return [TextContent(type="text", text=json.dumps(data, indent=2))]
-        
-        elif name == "get_network_health_dashboard":
-            # Try to get latest network log from Firestore
-            if db:
-                try:
-                    network_logs = db.collection("network_logs").order_by(
-                        "logged_at", direction=firestore.Query.DESCENDING
-                    ).limit(1).stream()
-                    
-                    latest_network = next(network_logs, None)
-                    
-                    if latest_network:
-                        net = latest_network.to_dict()
-                    else:
-                        net = {}
-                except Exception as e:
-                    print(f"Error reading network logs: {e}", file=sys.stderr, flush=True)
-                    net = {}
-            else:
-                net = {}
-            
-            # Extract or generate metrics
-            current = {
-                "ping_ms": net.get("ping_ms", random.randint(20, 50)),
-                "jitter_ms": net.get("jitter_ms", random.randint(1, 5)),
-                "download_mbps": net.get("download_mbps", random.randint(25, 100)),
-                "upload_mbps": net.get("upload_mbps", random.randint(10, 50)),
-                "packet_loss_percent": net.get("packet_loss_percent", 0),
-                "wifi_rssi_dbm": net.get("wifi_rssi_dbm", random.randint(-70, -50)),
-                "temperature_c": net.get("temperature_c", random.randint(45, 65)),
-                "active_devices": net.get("active_devices", 3)
-            }
-            
-            # Calculate health score (0-100)
-            health_score = 100
-            issues = []
-            recommendations = []
-            
-            # Evaluate metrics
-            if current["ping_ms"] > 100:
-                health_score -= 20
-                issues.append(f"High latency: {current['ping_ms']}ms")
-                recommendations.append("Check for bandwidth-heavy applications")
-            
-            if current["jitter_ms"] > 10:
-                health_score -= 15
-                issues.append(f"High jitter: {current['jitter_ms']}ms")
-                recommendations.append("Enable QoS on router")
-            
-            if current["download_mbps"] < 10:
-                health_score -= 25
-                issues.append(f"Low download speed: {current['download_mbps']}Mbps")
-                recommendations.append("Run speed test to verify ISP speed")
-            
-            if current["upload_mbps"] < 5:
-                health_score -= 20
-                issues.append(f"Low upload speed: {current['upload_mbps']}Mbps")
-                recommendations.append("Contact ISP if consistently low")
-            
-            if current["packet_loss_percent"] > 1:
-                health_score -= 30
-                issues.append(f"Packet loss: {current['packet_loss_percent']}%")
-                recommendations.append("Check cable connections and restart router")
-            
-            if current["wifi_rssi_dbm"] < -70:
-                health_score -= 15
-                issues.append(f"Weak WiFi signal: {current['wifi_rssi_dbm']}dBm")
-                recommendations.append("Move closer to router or use WiFi extender")
-            
-            if current["temperature_c"] > 70:
-                health_score -= 10
-                issues.append(f"High temperature: {current['temperature_c']}°C")
-                recommendations.append("Ensure proper ventilation around router")
-            
-            # Determine status
-            health_score = max(0, health_score)
-            
-            if health_score >= 90:
-                status = "excellent"
-                summary = "Your network is performing optimally!"
-            elif health_score >= 70:
-                status = "good"
-                summary = "Your network is performing well"
-            elif health_score >= 50:
-                status = "fair"
-                summary = "Your network has some issues that should be addressed"
-            else:
-                status = "poor"
-                summary = "Your network has significant issues requiring attention"
-            
-            # Build dashboard
-            dashboard = {
-                "timestamp": datetime.now(timezone.utc),
-                "health_score": health_score,
-                "status": status,
-                "summary": summary,
-                "current_metrics": current,
-                "issues": issues if issues else ["No issues detected"],
-                "recommendations": recommendations if recommendations else ["No recommendations at this time"]
-            }
-            
-            return [TextContent(type="text", text=json.dumps(dashboard, indent=2))]
-        
-        elif name == "get_latest_ai_request":
-            ai_request = get_latest_ai_request()
-            return [TextContent(type="text", text=json.dumps(ai_request, indent=2, default=str))]
-        
-        elif name == "get_latest_ai_response":
-            ai_response = get_latest_ai_response()
-            return [TextContent(type="text", text=json.dumps(ai_response, indent=2, default=str))]
-        
-        elif name == "process_pending_requests":
-            if db is None:
-                return [TextContent(type="text", text="Database not initialized")]
-            
-            # Get all pending requests
-            pending = db.collection('ai_requests').where('status', '==', 'pending').stream()
-            count = 0
-            
-            for doc in pending:
-                process_ai_request(doc.id, doc.to_dict())
-                count += 1
-            
-            return [TextContent(type="text", text=f"Processed {count} pending request(s)")]
-        
-        else:
-            return [TextContent(type="text", text=f"Unknown tool: {name}")]
+    handler = _HANDLERS.get(name)
+    if handler is None:
+        return _text(f"Unknown tool: {name}")
     
+    try:
+        return await handler(arguments)
     except Exception as e:
         error_msg = f"Error executing {name}: {str(e)}"
         print(error_msg, file=sys.stderr, flush=True)
-        return [TextContent(type="text", text=error_msg)]
+        return _text(error_msg)
+
+async def _start_listeners():
+    """Connect to Firestore off the event loop, then start the devices and AI request listeners"""
+    if await asyncio.to_thread(_get_db) is None:
+        return
+    
+    await asyncio.to_thread(watch_devices)
+    await asyncio.to_thread(watch_ai_requests)
+
+def _report_task_failure(task):
+    """Done-callback that logs a background task's exception instead of letting it vanish"""
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Background Firestore task failed: {task.exception()!r}", file=sys.stderr, flush=True)
 
 async def main():
     """Start the MCP server"""
+    global _write_queue
     print("Starting Home Network Copilot MCP Server...", file=sys.stderr, flush=True)
     
-    if db is not None:
-        watch_ai_requests()
+    # The queue exists before any Firestore work, so tool calls never fall back to writing on the event loop
+    _write_queue = asyncio.Queue()
+    writer_task = asyncio.create_task(_firestore_writer())  # keep references so they aren't GC'd
+    listeners_task = asyncio.create_task(_start_listeners())
+    for task in (writer_task, listeners_task):
+        task.add_done_callback(_report_task_failure)
     
     async with stdio_server() as (read_stream, write_stream):
         await app.run(